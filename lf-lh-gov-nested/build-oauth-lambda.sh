@@ -7,6 +7,15 @@ SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 LAMBDA_DIR="$SCRIPT_DIR/lambdas-oauth"
 OUTPUT_DIR="$SCRIPT_DIR/build"
 ZIP_FILE="oauth-query-handler.zip"
+# Target Lambda platform for native wheels (orjson) - must match the function's Architectures.
+# No template in this repo deploys this package; x86_64 matches Lambda's default architecture
+LAMBDA_ARCH="${LAMBDA_ARCH:-x86_64}"
+if [ "$LAMBDA_ARCH" = "arm64" ]; then
+    PIP_PLATFORM="manylinux2014_aarch64"
+else
+    PIP_PLATFORM="manylinux2014_x86_64"
+fi
+PYTHON_VERSION="3.11"
 
 echo "🔨 Building OAuth Lambda function..."
 
@@ -27,7 +36,9 @@ cp "$LAMBDA_DIR/requirements.txt" "$BUILD_DIR/"
 # Install dependencies if requirements.txt has packages
 if [ -s "$BUILD_DIR/requirements.txt" ]; then
     echo "📦 Installing Python dependencies..."
-    pip install -r "$BUILD_DIR/requirements.txt" -t "$BUILD_DIR/" --quiet
+    pip install -r "$BUILD_DIR/requirements.txt" -t "$BUILD_DIR/" --quiet \
+        --platform "$PIP_PLATFORM" --implementation cp --python-version "$PYTHON_VERSION" \
+        --only-binary=:all:
 else
     echo "ℹ️  No external dependencies (using boto3 from Lambda runtime)"
 fi
@@ -36,7 +47,7 @@ fi
 cd "$BUILD_DIR"
 zip -r "$OUTPUT_DIR/$ZIP_FILE" . -q
 
-echo "✅ Built: $OUTPUT_DIR/$ZIP_FILE"
+echo "✅ Built: $OUTPUT_DIR/$ZIP_FILE ($LAMBDA_ARCH)"
 echo ""
 echo "📤 Upload this file to S3:"
 echo "   aws s3 cp $OUTPUT_DIR/$ZIP_FILE s3://deploymen-bkt/lambda/"
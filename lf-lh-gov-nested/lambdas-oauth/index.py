@@ -2,16 +2,28 @@
 Lambda handler for OAuth 2.0 Proxy Pattern with AWS Cognito.
 Client sends client_id + client_secret, Lambda handles OAuth token exchange.
 """
-import json
 import boto3
+import orjson
 import os
+import logging
 import time
+import random
 import base64
 import hmac
 import hashlib
 from typing import Dict, Any, Optional
+import botocore.session
+from botocore.config import Config
+from botocore.credentials import RefreshableCredentials
 from botocore.exceptions import ClientError
 
+# Skip the EC2 metadata credential lookup; set here because no template deploys this package
+os.environ.setdefault('AWS_EC2_METADATA_DISABLED', 'true')
+
+# Root logger - set LOG_LEVEL=INFO in the function environment to trace OAuth requests
+logger = logging.getLogger()
+logger.setLevel(os.environ.get('LOG_LEVEL', 'WARNING'))
+
 # Environment variables
 COGNITO_USER_POOL_ID = os.environ['COGNITO_USER_POOL_ID']
 COGNITO_CLIENT_ID = os.environ['COGNITO_CLIENT_ID']
@@ -27,8 +39,29 @@ LF_SUPER_ROLE_ARN = os.environ['LF_SUPER_ROLE_ARN']
 cognito_client = boto3.client('cognito-idp', region_name=COGNITO_REGION)
 sts_client = boto3.client('sts', region_name=REGION)
 
-# Token cache (persists across warm Lambda invocations)
-token_cache = {}
+# Cognito groups mapped to Lake Formation roles
+ADMIN_GROUPS = frozenset({'Admins', 'SuperUsers', 'DataEngineers'})
+DEV_GROUPS = frozenset({'Developers', 'Analysts', 'DataScientists'})
+
+# Pre-keyed HMAC for Cognito SECRET_HASH - copied per request so the key schedule runs once
+_SECRET_HASH_HMAC = hmac.new(COGNITO_CLIENT_SECRET.encode('utf-8'), digestmod=hashlib.sha256)
+
+# Adaptive retries absorb Athena throttling when many OAuth users query at once
+ATHENA_CLIENT_CONFIG = Config(retries={'mode': 'adaptive'})
+
+# Athena status polling delays (seconds)
+QUERY_TERMINAL_STATES = ('SUCCEEDED', 'FAILED', 'CANCELLED')
+POLL_INITIAL_DELAY = 0.05
+POLL_MAX_DELAY = 2.0
+
+# Per-user Athena clients are created from this session's data loader, warmed by the init client
+_base_session = botocore.session.get_session()
+_athena_init_client = _base_session.create_client('athena', region_name=REGION, config=ATHENA_CLIENT_CONFIG)
+
+# Athena clients per (role_arn, session_name) - persist across warm invocations;
+# their assumed-role credentials refresh automatically before they expire
+MAX_CACHED_ATHENA_CLIENTS = 32
+_athena_clients: Dict[tuple, Any] = {}
 
 
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
@@ -52,8 +85,8 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     try:
         # Parse request body
         try:
-            body = json.loads(event.get('body', '{}'))
-        except json.JSONDecodeError:
+            body = orjson.loads(event.get('body') or '{}')
+        except orjson.JSONDecodeError:
             return error_response(400, "Invalid JSON in request body")
         
         # Extract authentication method
@@ -74,38 +107,37 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return error_response(401, "Authentication failed - invalid credentials")
         
         # Step 2: Extract user attributes and determine role
-        access_token = auth_result.get('AccessToken')
         id_token = auth_result.get('IdToken')
         
-        # Get user attributes from token
-        user_info = get_user_from_token(access_token)
+        # Get user attributes and groups from the ID token claims
+        user_info = get_user_from_id_token(id_token)
         if not user_info:
             return error_response(500, "Failed to retrieve user information")
         
         # Step 3: Map Cognito user to Lake Formation role
         lf_role_arn = map_cognito_user_to_lf_role(user_info)
         
-        print(f"✅ Authenticated user: {user_info.get('username')}, mapped to LF role: {lf_role_arn}")
+        logger.info("Authenticated user: %s, mapped to LF role: %s", user_info.get('username'), lf_role_arn)
         
         # Step 4: Assume Lake Formation role
-        assumed_credentials = assume_role(lf_role_arn, user_info.get('username', 'unknown'))
-        if not assumed_credentials:
+        athena_client = get_athena_client(lf_role_arn, user_info.get('username', 'unknown'))
+        if not athena_client:
             return error_response(500, "Failed to assume Lake Formation role")
         
         # Step 5: Execute Athena query with assumed credentials
-        query_execution_id = start_athena_query(query, assumed_credentials)
+        query_execution_id = start_athena_query(athena_client, query)
         if not query_execution_id:
             return error_response(500, "Failed to start Athena query")
         
         # Step 6: Wait for query completion
-        query_status = wait_for_query_completion(query_execution_id, assumed_credentials)
+        query_status = wait_for_query_completion(athena_client, query_execution_id)
         
         if query_status != 'SUCCEEDED':
-            error_info = get_query_error(query_execution_id, assumed_credentials)
+            error_info = get_query_error(athena_client, query_execution_id)
             return error_response(500, f"Query failed: {error_info}")
         
         # Step 7: Get query results
-        results = get_query_results(query_execution_id, assumed_credentials)
+        results = get_query_results(athena_client, query_execution_id)
         
         return {
             'statusCode': 200,
@@ -113,7 +145,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'Content-Type': 'application/json',
                 'Access-Control-Allow-Origin': '*'
             },
-            'body': json.dumps({
+            'body': orjson.dumps({
                 'success': True,
                 'authenticatedUser': user_info.get('username'),
                 'userGroups': user_info.get('groups', []),
@@ -121,13 +153,11 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'query': query,
                 'rowCount': len(results) - 1,  # Subtract header row
                 'data': results
-            })
+            }).decode()
         }
         
     except Exception as e:
-        print(f"❌ Unexpected error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Unexpected error: %s", e)
         return error_response(500, f"Internal server error: {str(e)}")
 
 
@@ -138,7 +168,7 @@ def authenticate_user(username: str, password: str) -> Optional[Dict[str, Any]]:
     """
     try:
         # Generate SECRET_HASH for authentication
-        secret_hash = calculate_secret_hash(username, COGNITO_CLIENT_ID, COGNITO_CLIENT_SECRET)
+        secret_hash = calculate_secret_hash(username)
         
         response = cognito_client.initiate_auth(
             ClientId=COGNITO_CLIENT_ID,
@@ -153,54 +183,56 @@ def authenticate_user(username: str, password: str) -> Optional[Dict[str, Any]]:
         return response.get('AuthenticationResult')
         
     except cognito_client.exceptions.NotAuthorizedException:
-        print(f"❌ Authentication failed for user: {username}")
+        logger.warning("Authentication failed for user: %s", username)
         return None
     except ClientError as e:
-        print(f"❌ Cognito error: {e.response['Error']['Message']}")
+        logger.error("Cognito error: %s", e.response['Error']['Message'])
         return None
 
 
-def calculate_secret_hash(username: str, client_id: str, client_secret: str) -> str:
+def calculate_secret_hash(username: str) -> str:
     """
     Calculate SECRET_HASH required by Cognito for app clients with secret.
+    HMAC-SHA256(client_secret, username + client_id), using the pre-keyed HMAC.
     """
-    message = username + client_id
-    secret = client_secret.encode('utf-8')
-    signature = hmac.new(secret, message.encode('utf-8'), hashlib.sha256).digest()
-    return base64.b64encode(signature).decode()
+    signature = _SECRET_HASH_HMAC.copy()
+    signature.update((username + COGNITO_CLIENT_ID).encode('utf-8'))
+    return base64.b64encode(signature.digest()).decode()
 
 
-def get_user_from_token(access_token: str) -> Optional[Dict[str, Any]]:
+def decode_jwt_claims(token: str) -> Dict[str, Any]:
     """
-    Get user information from Cognito access token.
+    Decode the claims (payload segment) of a JWT without a network call.
+    """
+    payload = token.split('.')[1]
+    payload += '=' * (-len(payload) % 4)
+    return orjson.loads(base64.urlsafe_b64decode(payload))
+
+
+def get_user_from_id_token(id_token: str) -> Optional[Dict[str, Any]]:
+    """
+    Build user information from the ID token claims.
+    
+    The ID token already carries cognito:username, cognito:groups and custom
+    attributes, so no GetUser / AdminListGroupsForUser calls are needed. Its
+    signature is not re-verified: the token was just returned to us by
+    InitiateAuth over TLS, authenticated with our own client secret.
     """
     try:
-        response = cognito_client.get_user(AccessToken=access_token)
-        
-        # Extract user attributes
-        user_info = {
-            'username': response['Username'],
-            'attributes': {},
-            'groups': []
-        }
+        claims = decode_jwt_claims(id_token)
         
-        for attr in response.get('UserAttributes', []):
-            user_info['attributes'][attr['Name']] = attr['Value']
-        
-        # Get user groups (requires separate API call)
-        try:
-            groups_response = cognito_client.admin_list_groups_for_user(
-                Username=response['Username'],
-                UserPoolId=COGNITO_USER_POOL_ID
-            )
-            user_info['groups'] = [g['GroupName'] for g in groups_response.get('Groups', [])]
-        except Exception as e:
-            print(f"⚠️  Could not retrieve user groups: {str(e)}")
+        if claims.get('token_use') != 'id':
+            logger.warning("Unexpected token_use: %s", claims.get('token_use'))
+            return None
         
-        return user_info
+        return {
+            'username': claims['cognito:username'],
+            'groups': claims.get('cognito:groups', []),
+            'attributes': {k: v for k, v in claims.items() if k.startswith('custom:')}
+        }
         
-    except ClientError as e:
-        print(f"❌ Failed to get user from token: {e.response['Error']['Message']}")
+    except Exception as e:
+        logger.error("Failed to decode ID token: %s", e)
         return None
 
 
@@ -217,15 +249,13 @@ def map_cognito_user_to_lf_role(user_info: Dict[str, Any]) -> str:
     username = user_info.get('username', '')
     
     # Check for admin/super user groups
-    admin_groups = {'Admins', 'SuperUsers', 'DataEngineers'}
-    if any(group in admin_groups for group in groups):
-        print(f"🔑 User {username} in admin group, granting Super User role")
+    if not ADMIN_GROUPS.isdisjoint(groups):
+        logger.info("User %s in admin group, granting Super User role", username)
         return LF_SUPER_ROLE_ARN
     
     # Check for developer groups
-    dev_groups = {'Developers', 'Analysts', 'DataScientists'}
-    if any(group in dev_groups for group in groups):
-        print(f"🔑 User {username} in dev group, granting Dev User role")
+    if not DEV_GROUPS.isdisjoint(groups):
+        logger.info("User %s in dev group, granting Dev User role", username)
         return LF_DEV_ROLE_ARN
     
     # Check custom attribute for role mapping
@@ -234,15 +264,51 @@ def map_cognito_user_to_lf_role(user_info: Dict[str, Any]) -> str:
         return LF_SUPER_ROLE_ARN
     
     # Default to dev user role
-    print(f"🔑 User {username} using default Dev User role")
+    logger.info("User %s using default Dev User role", username)
     return LF_DEV_ROLE_ARN
 
 
-def assume_role(role_arn: str, session_name: str) -> Optional[Dict[str, str]]:
+def get_athena_client(role_arn: str, session_name: str) -> Optional[Any]:
+    """
+    Return an Athena client running as the assumed Lake Formation role.
+    Clients are cached per role/session so warm invocations skip both the
+    STS call and client construction.
+    """
+    cache_key = (role_arn, session_name)
+    athena_client = _athena_clients.get(cache_key)
+    if athena_client is None:
+        credentials = assume_role(role_arn, session_name)
+        if not credentials:
+            return None
+        
+        role_session = _new_role_session(credentials)
+        athena_client = role_session.create_client('athena', region_name=REGION, config=ATHENA_CLIENT_CONFIG)
+        
+        if len(_athena_clients) >= MAX_CACHED_ATHENA_CLIENTS:
+            _athena_clients.pop(next(iter(_athena_clients)))
+        _athena_clients[cache_key] = athena_client
+    return athena_client
+
+
+def _new_role_session(credentials: RefreshableCredentials) -> botocore.session.Session:
+    """
+    Create a botocore session for one assumed role, sharing the base session's data loader.
+    
+    botocore has no public setter for a credentials object; this depends on
+    Session.get_credentials() returning Session._credentials when it is already set.
+    """
+    role_session = botocore.session.get_session()
+    role_session.register_component('data_loader', _base_session.get_component('data_loader'))
+    role_session._credentials = credentials
+    return role_session
+
+
+def assume_role(role_arn: str, session_name: str) -> Optional[RefreshableCredentials]:
     """
     Assume IAM role and return temporary credentials.
+    The credentials re-assume the role via STS shortly before they expire.
     """
-    try:
+    def fetch_credentials() -> Dict[str, str]:
         response = sts_client.assume_role(
             RoleArn=role_arn,
             RoleSessionName=f"cognito-user-{session_name}",
@@ -251,28 +317,28 @@ def assume_role(role_arn: str, session_name: str) -> Optional[Dict[str, str]]:
         
         credentials = response['Credentials']
         return {
-            'AccessKeyId': credentials['AccessKeyId'],
-            'SecretAccessKey': credentials['SecretAccessKey'],
-            'SessionToken': credentials['SessionToken']
+            'access_key': credentials['AccessKeyId'],
+            'secret_key': credentials['SecretAccessKey'],
+            'token': credentials['SessionToken'],
+            'expiry_time': credentials['Expiration'].isoformat()
         }
+    
+    try:
+        return RefreshableCredentials.create_from_metadata(
+            metadata=fetch_credentials(),
+            refresh_using=fetch_credentials,
+            method='sts-assume-role'
+        )
     except ClientError as e:
-        print(f"❌ Failed to assume role {role_arn}: {e.response['Error']['Message']}")
+        logger.error("Failed to assume role %s: %s", role_arn, e.response['Error']['Message'])
         return None
 
 
-def start_athena_query(query: str, credentials: Dict[str, str]) -> Optional[str]:
+def start_athena_query(athena_client: Any, query: str) -> Optional[str]:
     """
     Start Athena query execution with assumed role credentials.
     """
     try:
-        athena_client = boto3.client(
-            'athena',
-            region_name=REGION,
-            aws_access_key_id=credentials['AccessKeyId'],
-            aws_secret_access_key=credentials['SecretAccessKey'],
-            aws_session_token=credentials['SessionToken']
-        )
-        
         response = athena_client.start_query_execution(
             QueryString=query,
             QueryExecutionContext={'Database': DATABASE_NAME},
@@ -284,46 +350,38 @@ def start_athena_query(query: str, credentials: Dict[str, str]) -> Optional[str]
         return response['QueryExecutionId']
         
     except ClientError as e:
-        print(f"❌ Athena query failed: {e.response['Error']['Message']}")
+        logger.error("Athena query failed: %s", e.response['Error']['Message'])
         return None
 
 
-def wait_for_query_completion(query_execution_id: str, credentials: Dict[str, str], max_wait: int = 30) -> str:
+def wait_for_query_completion(athena_client: Any, query_execution_id: str, max_wait: int = 30,
+                              initial_delay: float = POLL_INITIAL_DELAY,
+                              max_delay: float = POLL_MAX_DELAY) -> str:
     """
     Wait for Athena query to complete. Returns query status.
+    Polls with exponential backoff from initial_delay up to max_delay seconds.
     """
-    athena_client = boto3.client(
-        'athena',
-        region_name=REGION,
-        aws_access_key_id=credentials['AccessKeyId'],
-        aws_secret_access_key=credentials['SecretAccessKey'],
-        aws_session_token=credentials['SessionToken']
-    )
+    delay = initial_delay
+    deadline = time.monotonic() + max_wait
     
-    for _ in range(max_wait):
+    while time.monotonic() < deadline:
         response = athena_client.get_query_execution(QueryExecutionId=query_execution_id)
         status = response['QueryExecution']['Status']['State']
         
-        if status in ['SUCCEEDED', 'FAILED', 'CANCELLED']:
+        if status in QUERY_TERMINAL_STATES:
             return status
         
-        time.sleep(1)
+        # Double the delay each poll, capped at max_delay; jitter spreads concurrent pollers
+        time.sleep(delay + random.uniform(0, delay * 0.1))
+        delay = min(delay * 2.0, max_delay)
     
     return 'TIMEOUT'
 
 
-def get_query_results(query_execution_id: str, credentials: Dict[str, str]) -> list:
+def get_query_results(athena_client: Any, query_execution_id: str) -> list:
     """
     Get Athena query results.
     """
-    athena_client = boto3.client(
-        'athena',
-        region_name=REGION,
-        aws_access_key_id=credentials['AccessKeyId'],
-        aws_secret_access_key=credentials['SecretAccessKey'],
-        aws_session_token=credentials['SessionToken']
-    )
-    
     response = athena_client.get_query_results(QueryExecutionId=query_execution_id)
     
     # Format results as list of dictionaries
@@ -334,30 +392,18 @@ def get_query_results(query_execution_id: str, credentials: Dict[str, str]) -> l
     # Extract column names from first row
     headers = [col['VarCharValue'] for col in rows[0]['Data']]
     
-    # Extract data rows
-    results = []
-    for row in rows[1:]:  # Skip header row
-        row_data = {}
-        for i, col in enumerate(row.get('Data', [])):
-            row_data[headers[i]] = col.get('VarCharValue', '')
-        results.append(row_data)
-    
-    return results
+    # Extract data rows (skip header row)
+    return [
+        dict(zip(headers, [col.get('VarCharValue', '') for col in row.get('Data', ())]))
+        for row in rows[1:]
+    ]
 
 
-def get_query_error(query_execution_id: str, credentials: Dict[str, str]) -> str:
+def get_query_error(athena_client: Any, query_execution_id: str) -> str:
     """
     Get detailed error information for failed query.
     """
     try:
-        athena_client = boto3.client(
-            'athena',
-            region_name=REGION,
-            aws_access_key_id=credentials['AccessKeyId'],
-            aws_secret_access_key=credentials['SecretAccessKey'],
-            aws_session_token=credentials['SessionToken']
-        )
-        
         response = athena_client.get_query_execution(QueryExecutionId=query_execution_id)
         state_change_reason = response['QueryExecution']['Status'].get('StateChangeReason', 'Unknown error')
         return state_change_reason
@@ -376,8 +422,8 @@ def error_response(status_code: int, message: str) -> Dict[str, Any]:
             'Content-Type': 'application/json',
             'Access-Control-Allow-Origin': '*'
         },
-        'body': json.dumps({
+        'body': orjson.dumps({
             'success': False,
             'error': message
-        })
+        }).decode()
     }
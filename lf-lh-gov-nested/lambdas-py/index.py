@@ -5,8 +5,23 @@ Maps API key to IAM role, assumes role, and executes query with LF TBAC.
 import json
 import boto3
 import os
+import logging
 import time
+import random
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, Optional
+import botocore.session
+from botocore.config import Config
+from botocore.credentials import RefreshableCredentials
+
+# No template in this repo deploys this handler, so IMDS is disabled here (Lambda credentials are env vars)
+os.environ.setdefault('AWS_EC2_METADATA_DISABLED', 'true')
+
+# Logging - defaults to WARNING; LOG_LEVEL=INFO enables per-request traces
+logger = logging.getLogger()
+logger.setLevel(os.environ.get('LOG_LEVEL', 'WARNING'))
 
 # Environment variables
 API_KEY_TABLE = os.environ['API_KEY_TABLE']
@@ -15,9 +30,39 @@ ATHENA_OUTPUT_BUCKET = os.environ['ATHENA_OUTPUT_BUCKET']
 REGION = os.environ['REGION']
 
 # AWS clients
-dynamodb = boto3.resource('dynamodb', region_name=REGION)
+dynamodb_client = boto3.client('dynamodb', region_name=REGION)
 sts_client = boto3.client('sts', region_name=REGION)
 
+# Athena client config - adaptive retry mode backs off automatically on throttling
+ATHENA_CLIENT_CONFIG = Config(retries={'mode': 'adaptive'})
+
+# Athena polling (exponential backoff, seconds)
+QUERY_TERMINAL_STATES = ('SUCCEEDED', 'FAILED', 'CANCELLED')
+POLL_INITIAL_DELAY = 0.05
+POLL_MAX_DELAY = 2.0
+
+# Athena returns at most 1000 rows per GetQueryResults call
+RESULTS_PAGE_SIZE = 1000
+
+# Worker that prefetches the next results page while the current one is parsed
+_page_prefetcher = ThreadPoolExecutor(max_workers=1)
+
+# Shared botocore session; the init-time Athena client preloads the service model for per-role clients
+_base_session = botocore.session.get_session()
+_athena_init_client = _base_session.create_client('athena', region_name=REGION, config=ATHENA_CLIENT_CONFIG)
+
+# Compact JSON encoder for response bodies
+_json_dumps = json.JSONEncoder(separators=(',', ':')).encode
+
+# API key -> role ARN cache (persists across warm invocations); API keys are stored hashed
+ROLE_CACHE_TTL = 300
+ROLE_CACHE_MAX_ENTRIES = 1024
+_role_cache: OrderedDict = OrderedDict()  # blake2b(api_key) -> (role_arn, expiry epoch)
+
+# Athena clients per assumed role (persist across warm invocations; credentials auto-refresh)
+MAX_CACHED_ATHENA_CLIENTS = 32
+_athena_clients: Dict[str, Any] = {}
+
 
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
@@ -60,26 +105,27 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return error_response(403, "Invalid API key")
         
         # Assume the role
-        assumed_credentials = assume_role(role_arn)
-        if not assumed_credentials:
+        athena_client = get_athena_client(role_arn)
+        if not athena_client:
             return error_response(500, "Failed to assume role")
         
         # Execute Athena query with assumed credentials
         # Wrap database and table names in double quotes to handle hyphens
         query = f'SELECT * FROM "{DATABASE_NAME}"."{table_name}" LIMIT {limit}'
         
-        query_execution_id = start_athena_query(query, assumed_credentials)
+        query_execution_id = start_athena_query(athena_client, query)
         if not query_execution_id:
             return error_response(500, "Failed to start query")
         
         # Wait for query to complete
-        query_status = wait_for_query_completion(query_execution_id, assumed_credentials)
+        query_status = wait_for_query_completion(athena_client, query_execution_id)
         
         if query_status != 'SUCCEEDED':
-            return error_response(500, f"Query failed with status: {query_status}")
+            error_info = get_query_error(athena_client, query_execution_id)
+            return error_response(500, f"Query failed with status: {query_status} - {error_info}")
         
         # Get query results
-        results = get_query_results(query_execution_id, assumed_credentials)
+        results = get_query_results(athena_client, query_execution_id)
         
         return {
             'statusCode': 200,
@@ -87,7 +133,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'Content-Type': 'application/json',
                 'Access-Control-Allow-Origin': '*'
             },
-            'body': json.dumps({
+            'body': _json_dumps({
                 'success': True,
                 'query': query,
                 'rowCount': len(results) - 1,  # Subtract header row
@@ -96,29 +142,80 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
         
     except Exception as e:
-        print(f"Unexpected error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Unexpected error: %s", e)
         return error_response(500, f"Internal server error: {str(e)}")
 
 
 def get_role_for_api_key(api_key: str) -> Optional[str]:
+    """Look up IAM role ARN for the given API key, cached in memory for ROLE_CACHE_TTL seconds."""
+    cache_key = hashlib.blake2b(api_key.encode('utf-8'), digest_size=16).digest()
+    cached = _role_cache.get(cache_key)
+    if cached and time.time() < cached[1]:
+        _role_cache.move_to_end(cache_key)
+        return cached[0]
+    
+    role_arn = _lookup_role(api_key)
+    if role_arn:
+        _role_cache[cache_key] = (role_arn, time.time() + ROLE_CACHE_TTL)
+        _role_cache.move_to_end(cache_key)
+        if len(_role_cache) > ROLE_CACHE_MAX_ENTRIES:
+            _role_cache.popitem(last=False)
+    
+    return role_arn
+
+
+def _lookup_role(api_key: str) -> Optional[str]:
     """Look up IAM role ARN for the given API key in DynamoDB."""
     try:
-        table = dynamodb.Table(API_KEY_TABLE)
-        response = table.get_item(Key={'apiKey': api_key})
+        response = dynamodb_client.get_item(
+            TableName=API_KEY_TABLE,
+            Key={'apiKey': {'S': api_key}},
+            ProjectionExpression='roleArn'
+        )
         
-        if 'Item' in response:
-            return response['Item'].get('roleArn')
+        item = response.get('Item')
+        if item and 'roleArn' in item:
+            return item['roleArn']['S']
         return None
     except Exception as e:
-        print(f"Error querying DynamoDB: {str(e)}")
+        logger.error("Error querying DynamoDB: %s", e)
         return None
 
 
-def assume_role(role_arn: str) -> Optional[Dict[str, str]]:
-    """Assume the specified IAM role and return temporary credentials."""
-    try:
+def get_athena_client(role_arn: str) -> Optional[Any]:
+    """Return an Athena client for the role, cached across warm invocations."""
+    athena_client = _athena_clients.get(role_arn)
+    if athena_client is None:
+        credentials = assume_role(role_arn)
+        if not credentials:
+            return None
+        
+        role_session = _new_role_session(credentials)
+        athena_client = role_session.create_client('athena', region_name=REGION, config=ATHENA_CLIENT_CONFIG)
+        
+        if len(_athena_clients) >= MAX_CACHED_ATHENA_CLIENTS:
+            _athena_clients.pop(next(iter(_athena_clients)))
+        _athena_clients[role_arn] = athena_client
+    return athena_client
+
+
+def _new_role_session(credentials: RefreshableCredentials) -> botocore.session.Session:
+    """
+    Build a botocore session that signs with the given refreshable credentials.
+    
+    Relies on botocore internals: Session.get_credentials() returns Session._credentials
+    when it is set, bypassing the provider chain. If a botocore upgrade breaks role
+    sessions, this is the place to fix.
+    """
+    role_session = botocore.session.get_session()
+    role_session.register_component('data_loader', _base_session.get_component('data_loader'))
+    role_session._credentials = credentials
+    return role_session
+
+
+def assume_role(role_arn: str) -> Optional[RefreshableCredentials]:
+    """Assume the specified IAM role and return temporary credentials that refresh themselves via STS."""
+    def fetch_credentials() -> Dict[str, str]:
         response = sts_client.assume_role(
             RoleArn=role_arn,
             RoleSessionName='athena-query-session',
@@ -127,26 +224,26 @@ def assume_role(role_arn: str) -> Optional[Dict[str, str]]:
         
         credentials = response['Credentials']
         return {
-            'aws_access_key_id': credentials['AccessKeyId'],
-            'aws_secret_access_key': credentials['SecretAccessKey'],
-            'aws_session_token': credentials['SessionToken']
+            'access_key': credentials['AccessKeyId'],
+            'secret_key': credentials['SecretAccessKey'],
+            'token': credentials['SessionToken'],
+            'expiry_time': credentials['Expiration'].isoformat()
         }
+    
+    try:
+        return RefreshableCredentials.create_from_metadata(
+            metadata=fetch_credentials(),
+            refresh_using=fetch_credentials,
+            method='sts-assume-role'
+        )
     except Exception as e:
-        print(f"Error assuming role {role_arn}: {str(e)}")
+        logger.error("Error assuming role %s: %s", role_arn, e)
         return None
 
 
-def start_athena_query(query: str, credentials: Dict[str, str]) -> Optional[str]:
+def start_athena_query(athena_client: Any, query: str) -> Optional[str]:
     """Start an Athena query using assumed credentials."""
     try:
-        athena_client = boto3.client(
-            'athena',
-            region_name=REGION,
-            aws_access_key_id=credentials['aws_access_key_id'],
-            aws_secret_access_key=credentials['aws_secret_access_key'],
-            aws_session_token=credentials['aws_session_token']
-        )
-        
         response = athena_client.start_query_execution(
             QueryString=query,
             QueryExecutionContext={
@@ -160,86 +257,81 @@ def start_athena_query(query: str, credentials: Dict[str, str]) -> Optional[str]
         
         return response['QueryExecutionId']
     except Exception as e:
-        print(f"Error starting Athena query: {str(e)}")
+        logger.error("Error starting Athena query: %s", e)
         return None
 
 
-def wait_for_query_completion(query_execution_id: str, credentials: Dict[str, str], 
-                               max_wait_seconds: int = 60) -> str:
-    """Wait for Athena query to complete and return final status."""
+def wait_for_query_completion(athena_client: Any, query_execution_id: str,
+                              max_wait_seconds: int = 60,
+                              initial_delay: float = POLL_INITIAL_DELAY,
+                              max_delay: float = POLL_MAX_DELAY) -> str:
+    """Wait for Athena query to complete (exponential backoff polling) and return final status."""
     try:
-        athena_client = boto3.client(
-            'athena',
-            region_name=REGION,
-            aws_access_key_id=credentials['aws_access_key_id'],
-            aws_secret_access_key=credentials['aws_secret_access_key'],
-            aws_session_token=credentials['aws_session_token']
-        )
+        delay = initial_delay
+        deadline = time.monotonic() + max_wait_seconds
         
-        start_time = time.time()
-        
-        while True:
+        while time.monotonic() < deadline:
             response = athena_client.get_query_execution(
                 QueryExecutionId=query_execution_id
             )
             
             status = response['QueryExecution']['Status']['State']
             
-            if status in ['SUCCEEDED', 'FAILED', 'CANCELLED']:
+            if status in QUERY_TERMINAL_STATES:
                 return status
             
-            if time.time() - start_time > max_wait_seconds:
-                return 'TIMEOUT'
-            
-            time.sleep(1)
+            # Exponential backoff (2x up to max_delay) with up to 10% jitter
+            time.sleep(delay + random.uniform(0, delay * 0.1))
+            delay = min(delay * 2.0, max_delay)
+        
+        return 'TIMEOUT'
             
     except Exception as e:
-        print(f"Error waiting for query: {str(e)}")
+        logger.error("Error waiting for query: %s", e)
         return 'ERROR'
 
 
-def get_query_results(query_execution_id: str, credentials: Dict[str, str]) -> list:
+def get_query_results(athena_client: Any, query_execution_id: str) -> list:
     """Retrieve results from completed Athena query."""
     try:
-        athena_client = boto3.client(
-            'athena',
-            region_name=REGION,
-            aws_access_key_id=credentials['aws_access_key_id'],
-            aws_secret_access_key=credentials['aws_secret_access_key'],
-            aws_session_token=credentials['aws_session_token']
-        )
+        pages = iter(athena_client.get_paginator('get_query_results').paginate(
+            QueryExecutionId=query_execution_id,
+            PaginationConfig={'PageSize': RESULTS_PAGE_SIZE}
+        ))
         
         results = []
-        next_token = None
+        next_page = _page_prefetcher.submit(next, pages, None)
         
         while True:
-            if next_token:
-                response = athena_client.get_query_results(
-                    QueryExecutionId=query_execution_id,
-                    NextToken=next_token
-                )
-            else:
-                response = athena_client.get_query_results(
-                    QueryExecutionId=query_execution_id
-                )
+            response = next_page.result()
+            if response is None:
+                break
             
-            # Extract rows
-            for row in response['ResultSet']['Rows']:
-                row_data = [field.get('VarCharValue', '') for field in row['Data']]
-                results.append(row_data)
+            # Prefetch the following page while this one is parsed
+            next_page = _page_prefetcher.submit(next, pages, None)
             
-            # Check for more pages
-            next_token = response.get('NextToken')
-            if not next_token:
-                break
+            # Extract rows
+            results.extend([
+                [field.get('VarCharValue', '') for field in row['Data']]
+                for row in response['ResultSet']['Rows']
+            ])
         
         return results
         
     except Exception as e:
-        print(f"Error getting query results: {str(e)}")
+        logger.error("Error getting query results: %s", e)
         return []
 
 
+def get_query_error(athena_client: Any, query_execution_id: str) -> str:
+    """Retrieve the failure reason for an Athena query using the caller's client."""
+    try:
+        response = athena_client.get_query_execution(QueryExecutionId=query_execution_id)
+        return response['QueryExecution']['Status'].get('StateChangeReason', 'Unknown error')
+    except Exception as e:
+        return f"Could not retrieve error details: {str(e)}"
+
+
 def error_response(status_code: int, message: str) -> Dict[str, Any]:
     """Generate error response."""
     return {
@@ -248,7 +340,7 @@ def error_response(status_code: int, message: str) -> Dict[str, Any]:
             'Content-Type': 'application/json',
             'Access-Control-Allow-Origin': '*'
         },
-        'body': json.dumps({
+        'body': _json_dumps({
             'success': False,
             'error': message
         })
@@ -0,0 +1,37 @@
+#!/bin/bash
+set -e
+
+# Build and upload the StoreAPIKeys custom resource Lambda (handler-custom-resource.handler)
+# Usage: ./build-custom-resource.sh <s3-bucket> [s3-key]
+# Deploy order: run this BEFORE updating the lf-api-key-poc stack, so the custom resource
+# writes apiKeyHash for every mapping when it re-runs.
+
+S3_BUCKET=${1:-"lf-apikey-lambda-artifacts-dev-480399101976"}
+S3_KEY=${2:-"lambda/api-key-poc/store-api-keys-v3.zip"}
+
+echo "🔨 Building StoreAPIKeys custom resource Lambda..."
+
+# Install dependencies
+echo "📦 Installing dependencies..."
+npm install
+
+# Build TypeScript
+echo "🏗️  Compiling TypeScript..."
+npm run build
+
+# Create deployment package (AWS SDK v3 is provided by the nodejs20.x runtime)
+echo "📦 Creating deployment package..."
+cd dist
+rm -f ../store-api-keys.zip
+zip -r ../store-api-keys.zip . -x "*.map"
+cd ..
+
+# Upload to S3
+echo "☁️  Uploading to S3..."
+aws s3 cp store-api-keys.zip "s3://${S3_BUCKET}/${S3_KEY}"
+
+echo "✅ Custom resource package uploaded to s3://${S3_BUCKET}/${S3_KEY}"
+echo ""
+echo "Next steps:"
+echo "1. Deploy/update the lf-api-key-poc stack with CustomResourceCodeS3Key=${S3_KEY}"
+echo "   (use a new key for every build so CloudFormation picks up the new code)"
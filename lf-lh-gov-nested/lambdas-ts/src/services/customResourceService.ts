@@ -2,6 +2,7 @@
  * Custom Resource Service
  * Handles CloudFormation custom resource logic for API key provisioning
  */
+import { createHash } from 'crypto';
 import {
   APIGatewayClient,
   GetApiKeyCommand,
@@ -75,11 +76,13 @@ export class CustomResourceService {
     // 1. Get API key value from API Gateway
     logger.info(`Retrieving API key for ${UserName}...`, { apiKeyId: APIKeyId });
     const apiKeyValue = await this.getAPIKeyValue(APIKeyId);
+    const apiKeyHash = createHash('sha256').update(apiKeyValue).digest('hex');
 
     // 2. Store in Secrets Manager
     const secretArn = await this.storeSecret(
       SecretName,
       apiKeyValue,
+      apiKeyHash,
       UserName,
       GroupLabel,
       APIKeyId,
@@ -91,6 +94,7 @@ export class CustomResourceService {
       tableName,
       SecretName,
       secretArn,
+      apiKeyHash,
       RoleArn,
       UserName,
       GroupLabel,
@@ -131,6 +135,7 @@ export class CustomResourceService {
   private async storeSecret(
     secretName: string,
     apiKeyValue: string,
+    apiKeyHash: string,
     userName: string,
     groupLabel: string,
     apiKeyId: string,
@@ -138,6 +143,7 @@ export class CustomResourceService {
   ): Promise<string> {
     const secretData: SecretData = {
       apiKey: apiKeyValue,
+      apiKeyHash,
       userName,
       groupLabel,
       apiKeyId,
@@ -191,12 +197,13 @@ export class CustomResourceService {
   }
 
   /**
-   * Store mapping in DynamoDB
+   * Store mapping in DynamoDB (apiKeyHash is indexed for request-time lookups)
    */
   private async storeDynamoDBMapping(
     tableName: string,
     secretName: string,
     secretArn: string,
+    apiKeyHash: string,
     roleArn: string,
     userName: string,
     groupLabel: string,
@@ -207,6 +214,7 @@ export class CustomResourceService {
       Item: {
         secretName: { S: secretName },
         secretArn: { S: secretArn },
+        apiKeyHash: { S: apiKeyHash },
         roleArn: { S: roleArn },
         userName: { S: userName },
         groupLabel: { S: groupLabel },
@@ -61,6 +61,7 @@ export interface CustomResourceResponse {
 
 export interface SecretData {
   apiKey: string;
+  apiKeyHash: string;
   userName: string;
   groupLabel: string;
   apiKeyId: string;
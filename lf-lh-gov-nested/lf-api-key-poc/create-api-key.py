@@ -16,14 +16,13 @@ import argparse
 import boto3
 import json
 import secrets
-import string
-from typing import Optional
+from typing import Optional, Tuple
 
 
 def generate_api_key(length: int = 32) -> str:
-    """Generate a secure random API key"""
-    alphabet = string.ascii_letters + string.digits
-    return ''.join(secrets.choice(alphabet) for _ in range(length))
+    """Generate a secure random URL-safe API key (A-Z, a-z, 0-9, '-', '_')"""
+    # Each random byte yields 4/3 base64 characters - read enough bytes in one call
+    return secrets.token_urlsafe((length * 3 + 3) // 4)[:length]
 
 
 def create_secret(
@@ -33,8 +32,8 @@ def create_secret(
     user_name: str,
     permissions: str,
     environment: str
-) -> str:
-    """Create or update a secret in Secrets Manager"""
+) -> Tuple[str, bool]:
+    """Create or update a secret in Secrets Manager. Returns (secret ARN, whether it was newly created)"""
     
     secret_value = {
         "apiKey": api_key,
@@ -55,7 +54,7 @@ def create_secret(
             ]
         )
         print(f"✓ Created secret: {secret_name}")
-        return response['ARN']
+        return response['ARN'], True
     except secrets_client.exceptions.ResourceExistsException:
         # Secret already exists, update it
         response = secrets_client.update_secret(
@@ -63,7 +62,17 @@ def create_secret(
             SecretString=json.dumps(secret_value)
         )
         print(f"✓ Updated existing secret: {secret_name}")
-        return response['ARN']
+        return response['ARN'], False
+
+
+def delete_secret(secrets_client: boto3.client, secret_arn: str) -> None:
+    """Delete a secret immediately (used to roll back a partially created API key)"""
+    
+    secrets_client.delete_secret(
+        SecretId=secret_arn,
+        ForceDeleteWithoutRecovery=True
+    )
+    print(f"✓ Rolled back secret: {secret_arn}")
 
 
 def create_dynamodb_mapping(
@@ -153,7 +162,7 @@ def main():
     
     # Step 1: Create secret in Secrets Manager
     print("Step 1: Creating secret in Secrets Manager...")
-    secret_arn = create_secret(
+    secret_arn, secret_created = create_secret(
         secrets_client,
         secret_name,
         api_key,
@@ -163,15 +172,23 @@ def main():
     )
     
     # Step 2: Create mapping in DynamoDB
+    # (the mapping is keyed by the secret ARN, so it can only be written after step 1)
     print("\nStep 2: Creating mapping in DynamoDB...")
-    create_dynamodb_mapping(
-        dynamodb_client,
-        table_name,
-        secret_arn,
-        args.role_arn,
-        args.user_name,
-        args.permissions
-    )
+    try:
+        create_dynamodb_mapping(
+            dynamodb_client,
+            table_name,
+            secret_arn,
+            args.role_arn,
+            args.user_name,
+            args.permissions
+        )
+    except Exception:
+        # Don't leave an orphaned secret (an API key with no role mapping) behind
+        print("✗ Failed to create DynamoDB mapping")
+        if secret_created:
+            delete_secret(secrets_client, secret_arn)
+        raise
     
     # Display results
     print(f"\n{'='*60}")
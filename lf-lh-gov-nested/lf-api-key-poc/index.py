@@ -1,35 +1,62 @@
 """
-Lambda handler with secret scanning + DynamoDB lookup
-Scans secrets with lf-apikey-* pattern, finds match, then looks up role in DynamoDB
+Lambda handler with hashed API key lookup in DynamoDB
+Hashes the incoming API key and resolves its role with a single DynamoDB lookup
 """
 import json
 import os
+import base64
+import hashlib
+import hmac
+import random
+import time
 import boto3
 from botocore.exceptions import ClientError
 
-secretsmanager = boto3.client('secretsmanager')
 dynamodb = boto3.client('dynamodb')
+secretsmanager = boto3.client('secretsmanager')
 sts = boto3.client('sts')
 athena = boto3.client('athena')
 s3 = boto3.client('s3')
 
+# Compact JSON encoder for response bodies
+_json_dumps = json.JSONEncoder(separators=(',', ':')).encode
+
+# CORS headers for every response
+_RESPONSE_HEADERS = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key',
+    'Access-Control-Allow-Methods': 'POST,OPTIONS'
+}
+
 DYNAMODB_TABLE = os.environ['DYNAMODB_TABLE']
 ENVIRONMENT = os.environ['ENVIRONMENT']
 ATHENA_OUTPUT_BUCKET = os.environ['ATHENA_OUTPUT_BUCKET']
 ATHENA_OUTPUT_PREFIX = os.environ.get('ATHENA_OUTPUT_PREFIX', 'query-results/')
+API_KEY_HASH_INDEX = os.environ.get('API_KEY_HASH_INDEX', 'ApiKeyHashIndex')
+
+# Athena status polling (seconds)
+POLL_INITIAL_DELAY = 0.05
+POLL_MAX_DELAY = 1.0
+POLL_BACKOFF_FACTOR = 1.5
+RESULTS_PAGE_SIZE = 1000
+
+# Athena clients per (role, user), re-assumed within 5 minutes of expiry
+CREDENTIAL_REFRESH_MARGIN_SECONDS = 300
+_assumed_athena_clients = {}  # (role_arn, user_name) -> (athena client, credential expiry epoch)
 
 
 def handler(event, context):
     """
-    Main Lambda handler with secret scanning + DynamoDB lookup
+    Main Lambda handler with hashed API key lookup
     
     Flow:
     1. Extract API key from headers (x-api-key)
-    2. List secrets with naming pattern "lf-apikey-*-{env}"
-    3. Check each secret's value for match with incoming API key
-    4. Use matched secret name to lookup DynamoDB
-    5. Get roleArn from DynamoDB
-    6. Assume role & execute Athena query
+    2. Compute SHA-256 hash of the API key
+    3. Query DynamoDB ApiKeyHashIndex with the hash
+       (falls back to the legacy secret scan for mappings written without apiKeyHash)
+    4. Get roleArn from the matched mapping
+    5. Assume role & execute Athena query
     """
     try:
         # Extract API key from headers (mandatory)
@@ -39,72 +66,51 @@ def handler(event, context):
         if not api_key:
             return create_response(401, {'error': 'Missing required x-api-key header'})
         
-        print(f"Searching for API key match in secrets with pattern: lf-apikey-*-{ENVIRONMENT}")
-        
-        # List secrets with our naming pattern
-        try:
-            list_response = secretsmanager.list_secrets(
-                Filters=[
-                    {'Key': 'name', 'Values': [f'lf-apikey-']},
-                    {'Key': 'tag-key', 'Values': ['LFAPIKeyType']}
-                ],
-                MaxResults=20
-            )
-        except ClientError as e:
-            print(f"Error listing secrets: {e}")
-            return create_response(500, {'error': 'Secret listing failed'})
-        
-        # Check each secret for matching API key
-        matched_secret_name = None
-        user_name = None
-        
-        for secret_metadata in list_response.get('SecretList', []):
-            secret_name = secret_metadata['Name']
-            
-            # Only check secrets for our environment
-            if not secret_name.endswith(f'-{ENVIRONMENT}'):
-                continue
-            
-            try:
-                secret_response = secretsmanager.get_secret_value(SecretId=secret_name)
-                secret_data = json.loads(secret_response['SecretString'])
-                
-                # Check if API key matches
-                if secret_data.get('apiKey') == api_key:
-                    matched_secret_name = secret_name
-                    user_name = secret_data.get('userName', 'unknown')
-                    print(f"Found matching API key in secret: {secret_name}, user: {user_name}")
-                    break
-                    
-            except ClientError as e:
-                print(f"Error reading secret {secret_name}: {e}")
-                continue
-        
-        # If no match found in secrets
-        if not matched_secret_name:
-            print(f"No matching API key found in secrets")
-            return create_response(403, {'error': 'Invalid API key'})
-        
-        # Lookup role ARN in DynamoDB using secret name
-        print(f"Looking up DynamoDB mapping for secret: {matched_secret_name}")
+        # Resolve the API key in a single lookup on its SHA-256 hash
+        api_key_hash = hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+        print(f"Looking up DynamoDB mapping for API key hash: {api_key_hash[:12]}...")
         try:
-            dynamo_response = dynamodb.get_item(
+            dynamo_response = dynamodb.query(
                 TableName=DYNAMODB_TABLE,
-                Key={'secretName': {'S': matched_secret_name}}
+                IndexName=API_KEY_HASH_INDEX,
+                KeyConditionExpression='apiKeyHash = :h',
+                ExpressionAttributeValues={':h': {'S': api_key_hash}},
+                Limit=1
             )
         except ClientError as e:
             print(f"DynamoDB error: {e}")
             return create_response(500, {'error': 'Database lookup failed'})
         
-        if 'Item' not in dynamo_response:
-            print(f"No DynamoDB mapping found for secret: {matched_secret_name}")
-            return create_response(500, {'error': 'Configuration error: missing role mapping'})
+        items = dynamo_response.get('Items', [])
+        if items and hmac.compare_digest(items[0]['apiKeyHash']['S'], api_key_hash):
+            mapping = items[0]
+        else:
+            # Mappings provisioned before apiKeyHash was stored are not in the index yet
+            print("No hash index entry found, falling back to secret scan")
+            try:
+                mapping = find_mapping_by_secret_scan(api_key)
+            except ClientError as e:
+                print(f"Legacy API key lookup error: {e}")
+                return create_response(500, {'error': 'API key lookup failed'})
+            except LookupError as e:
+                print(f"No DynamoDB mapping found for secret: {e}")
+                return create_response(500, {'error': 'Configuration error: missing role mapping'})
+            
+            if not mapping:
+                print("No matching API key mapping found")
+                return create_response(403, {'error': 'Invalid API key'})
+        
+        user_name = mapping.get('userName', {}).get('S', 'unknown')
+        print(f"Found matching API key for secret: {mapping['secretName']['S']}, user: {user_name}")
         
-        role_arn = dynamo_response['Item']['roleArn']['S']
+        role_arn = mapping['roleArn']['S']
         print(f"Found role mapping: user={user_name}, role={role_arn}")
         
         # Parse request body
-        body = json.loads(event.get('body', '{}'))
+        raw_body = event.get('body') or b'{}'
+        if event.get('isBase64Encoded'):
+            raw_body = base64.b64decode(raw_body)
+        body = json.loads(raw_body)
         table_name = body.get('tableName')
         database = body.get('database')
         query = body.get('query')
@@ -122,27 +128,13 @@ def handler(event, context):
             database = database or 'default'
             query = f"SELECT * FROM {database}.{table_name} LIMIT {limit}"
         
-        # Assume the role
-        print(f"Assuming role: {role_arn}")
+        # Get Athena client with assumed role credentials
         try:
-            assume_response = sts.assume_role(
-                RoleArn=role_arn,
-                RoleSessionName=f"lf-athena-session-{user_name}",
-                DurationSeconds=3600
-            )
-            credentials = assume_response['Credentials']
+            athena_assumed = get_athena_client(role_arn, user_name)
         except ClientError as e:
             print(f"AssumeRole error: {e}")
             return create_response(500, {'error': 'Failed to assume role'})
         
-        # Create Athena client with assumed credentials
-        athena_assumed = boto3.client(
-            'athena',
-            aws_access_key_id=credentials['AccessKeyId'],
-            aws_secret_access_key=credentials['SecretAccessKey'],
-            aws_session_token=credentials['SessionToken']
-        )
-        
         # Execute Athena query
         print(f"Executing query: {query}")
         query_execution_id = start_athena_query(athena_assumed, query, database)
@@ -162,6 +154,69 @@ def handler(event, context):
         return create_response(500, {'error': str(e)})
 
 
+def find_mapping_by_secret_scan(api_key):
+    """
+    Legacy lookup: match the API key against lf-apikey-* secrets, then read the mapping by secret name.
+    Returns None if no secret matches; raises LookupError if a secret matches but has no mapping.
+    """
+    list_response = secretsmanager.list_secrets(
+        Filters=[
+            {'Key': 'name', 'Values': ['lf-apikey-']},
+            {'Key': 'tag-key', 'Values': ['LFAPIKeyType']},
+            {'Key': 'tag-value', 'Values': [ENVIRONMENT]}
+        ],
+        MaxResults=20
+    )
+    
+    for secret_metadata in list_response.get('SecretList', []):
+        secret_name = secret_metadata['Name']
+        if not secret_name.endswith(f'-{ENVIRONMENT}'):
+            continue
+        
+        try:
+            secret_response = secretsmanager.get_secret_value(SecretId=secret_name)
+        except ClientError as e:
+            print(f"Error reading secret {secret_name}: {e}")
+            continue
+        
+        secret_data = json.loads(secret_response['SecretString'])
+        if hmac.compare_digest(secret_data.get('apiKey', '').encode('utf-8'), api_key.encode('utf-8')):
+            dynamo_response = dynamodb.get_item(
+                TableName=DYNAMODB_TABLE,
+                Key={'secretName': {'S': secret_name}}
+            )
+            if 'Item' not in dynamo_response:
+                raise LookupError(secret_name)
+            return dynamo_response['Item']
+    
+    return None
+
+
+def get_athena_client(role_arn, user_name):
+    """Return an Athena client for the assumed role, re-assuming only when credentials near expiry"""
+    cache_key = (role_arn, user_name)
+    cached = _assumed_athena_clients.get(cache_key)
+    if cached and cached[1] - time.time() > CREDENTIAL_REFRESH_MARGIN_SECONDS:
+        return cached[0]
+    
+    print(f"Assuming role: {role_arn}")
+    assume_response = sts.assume_role(
+        RoleArn=role_arn,
+        RoleSessionName=f"lf-athena-session-{user_name}",
+        DurationSeconds=3600
+    )
+    credentials = assume_response['Credentials']
+    
+    athena_client = boto3.client(
+        'athena',
+        aws_access_key_id=credentials['AccessKeyId'],
+        aws_secret_access_key=credentials['SecretAccessKey'],
+        aws_session_token=credentials['SessionToken']
+    )
+    _assumed_athena_clients[cache_key] = (athena_client, credentials['Expiration'].timestamp())
+    return athena_client
+
+
 def start_athena_query(athena_client, query, database):
     """Start Athena query execution"""
     # Ensure proper S3 path format with trailing slash
@@ -183,63 +238,53 @@ def start_athena_query(athena_client, query, database):
 
 def wait_for_query_completion(athena_client, query_execution_id, max_wait=60):
     """Wait for Athena query to complete and return results"""
-    import time
-    
-    waited = 0
-    while waited < max_wait:
+    deadline = time.monotonic() + max_wait
+    delay = POLL_INITIAL_DELAY
+    while time.monotonic() < deadline:
         response = athena_client.get_query_execution(
             QueryExecutionId=query_execution_id
         )
         state = response['QueryExecution']['Status']['State']
         
         if state == 'SUCCEEDED':
-            # Get query results
-            results_response = athena_client.get_query_results(
+            # Get query results in 1000-row pages
+            paginator = athena_client.get_paginator('get_query_results')
+            pages = paginator.paginate(
                 QueryExecutionId=query_execution_id,
-                MaxResults=100
+                PaginationConfig={'PageSize': RESULTS_PAGE_SIZE}
             )
-            return format_results(results_response)
+            return format_results([row for page in pages for row in page['ResultSet']['Rows']])
         
         elif state in ['FAILED', 'CANCELLED']:
             reason = response['QueryExecution']['Status'].get('StateChangeReason', 'Unknown')
             raise Exception(f"Query {state}: {reason}")
         
-        time.sleep(2)
-        waited += 2
+        time.sleep(delay * random.uniform(0.8, 1.2))
+        delay = min(delay * POLL_BACKOFF_FACTOR, POLL_MAX_DELAY)
     
     raise Exception(f"Query timeout after {max_wait} seconds")
 
 
-def format_results(results_response):
-    """Format Athena results into readable JSON"""
-    rows = results_response['ResultSet']['Rows']
+def format_results(rows):
+    """Format Athena result rows (header first) into readable JSON"""
     
     if len(rows) < 2:
         return []
     
     # Extract column names
-    columns = [col['VarCharValue'] for col in rows[0]['Data']]
+    columns = tuple(col['VarCharValue'] for col in rows[0]['Data'])
     
     # Extract data rows
-    data = []
-    for row in rows[1:]:
-        row_data = {}
-        for i, col in enumerate(row['Data']):
-            row_data[columns[i]] = col.get('VarCharValue', '')
-        data.append(row_data)
-    
-    return data
+    return [
+        dict(zip(columns, [col.get('VarCharValue', '') for col in row['Data']]))
+        for row in rows[1:]
+    ]
 
 
 def create_response(status_code, body):
     """Create HTTP response"""
     return {
         'statusCode': status_code,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key',
-            'Access-Control-Allow-Methods': 'POST,OPTIONS'
-        },
-        'body': json.dumps(body)
+        'headers': _RESPONSE_HEADERS,
+        'body': _json_dumps(body)
     }
@@ -46,7 +46,9 @@ def handler(event, context):
             list_response = secretsmanager.list_secrets(
                 Filters=[
                     {'Key': 'name', 'Values': [f'lf-apikey-']},
-                    {'Key': 'tag-key', 'Values': ['LFAPIKeyType']}
+                    {'Key': 'tag-key', 'Values': ['LFAPIKeyType']},
+                    # Secrets are tagged Environment=<env> at provisioning; filter server-side
+                    {'Key': 'tag-value', 'Values': [ENVIRONMENT]}
                 ],
                 MaxResults=20
             )
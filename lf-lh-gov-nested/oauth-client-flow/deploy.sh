@@ -49,11 +49,25 @@ echo "  Super Role: $LF_SUPER_ROLE_ARN"
 echo "  Database: $DATABASE_NAME"
 echo ""
 
-# Step 1: Package Lambda function
-echo "📦 Packaging Lambda function..."
-cd lambda
-zip -r ../oauth-client-creds-handler.zip index.py
-cd ..
+# Step 1: Package Lambda function (native wheels: cryptography, cffi, orjson)
+# LAMBDA_ARCH must match Architectures in lambda-client-creds-stack.yaml - change both together
+LAMBDA_ARCH="${LAMBDA_ARCH:-arm64}"
+if [ "$LAMBDA_ARCH" = "arm64" ]; then
+  PIP_PLATFORM="manylinux2014_aarch64"
+else
+  PIP_PLATFORM="manylinux2014_x86_64"
+fi
+echo "📦 Packaging Lambda function ($LAMBDA_ARCH)..."
+BUILD_DIR=$(mktemp -d)
+trap "rm -rf $BUILD_DIR" EXIT
+cp lambda/index.py "$BUILD_DIR/"
+pip install -r lambda/requirements.txt -t "$BUILD_DIR/" --quiet \
+  --platform "$PIP_PLATFORM" --implementation cp --python-version 3.11 \
+  --only-binary=:all:
+rm -f oauth-client-creds-handler.zip
+cd "$BUILD_DIR"
+zip -r -q "$OLDPWD/oauth-client-creds-handler.zip" .
+cd "$OLDPWD"
 
 # Step 2: Upload Lambda to S3
 echo "☁️  Uploading Lambda to S3..."
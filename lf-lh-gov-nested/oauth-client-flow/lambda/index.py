@@ -2,12 +2,18 @@
 Lambda handler for OAuth Client Credentials flow.
 Validates Bearer token and maps client_id to Lake Formation role.
 """
-import json
 import boto3
+import orjson
 import os
+import re
 import time
+import random
 import base64
-from typing import Dict, Any, Optional
+import binascii
+from functools import lru_cache
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+import jwt
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
 # Environment variables
@@ -21,7 +27,28 @@ LF_SUPER_ROLE_ARN = os.environ['LF_SUPER_ROLE_ARN']
 
 # AWS clients
 sts_client = boto3.client('sts', region_name=REGION)
-athena_client = boto3.client('athena', region_name=REGION)
+
+# Cognito User Pool token issuer; signing keys are fetched on first use and cached for the life of the container
+_EXPECTED_ISSUER = f"https://cognito-idp.{COGNITO_REGION}.amazonaws.com/{COGNITO_USER_POOL_ID}"
+JWKS_URL = f"{_EXPECTED_ISSUER}/.well-known/jwks.json"
+_jwks_client = jwt.PyJWKClient(JWKS_URL, cache_keys=True)
+
+# Athena clients per (role, client_id); see get_athena_client
+ATHENA_CLIENT_CONFIG = Config(max_pool_connections=50, retries={'mode': 'standard'})
+CREDENTIAL_REFRESH_MARGIN_SECONDS = 300
+_assumed_athena_clients: Dict[Tuple[str, str], Tuple[Any, float]] = {}
+
+# Poll delays in seconds; results are paged 1000 rows at a time
+POLL_INITIAL_DELAY = 0.05
+POLL_MAX_DELAY = 1.0
+POLL_BACKOFF_FACTOR = 1.5
+RESULTS_PAGE_SIZE = 1000
+
+# Headers shared by success_response and error_response
+_RESPONSE_HEADERS = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*'
+}
 
 # Client ID to Role Mapping
 # This maps specific client IDs to their Lake Formation roles
@@ -34,6 +61,11 @@ CLIENT_ROLE_MAPPING = {
     'monitoring-service': LF_DEV_ROLE_ARN,
 }
 
+# Single compiled pattern finding every known client prefix (lookahead so overlapping matches are kept);
+# when several match, the earliest entry in CLIENT_ROLE_MAPPING wins, as with the original dict scan
+_CLIENT_PREFIX_RE = re.compile('(?=(' + '|'.join(re.escape(prefix) for prefix in CLIENT_ROLE_MAPPING) + '))')
+_CLIENT_PREFIX_PRIORITY = {prefix: i for i, prefix in enumerate(CLIENT_ROLE_MAPPING)}
+
 # Scope to Role Mapping (fallback if client_id not in mapping)
 SCOPE_ROLE_MAPPING = {
     'athena-api/query.admin': LF_SUPER_ROLE_ARN,
@@ -41,6 +73,10 @@ SCOPE_ROLE_MAPPING = {
     'athena-api/query.read': LF_DEV_ROLE_ARN,
 }
 
+# Scope privilege levels, checked highest first
+_WRITE_SCOPES = frozenset({'athena-api/query.admin', 'athena-api/query.write'})
+_READ_SCOPES = frozenset({'athena-api/query.read'})
+
 
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
@@ -64,8 +100,11 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         # Parse request body
         try:
-            body = json.loads(event.get('body', '{}'))
-        except json.JSONDecodeError:
+            raw_body = event.get('body') or b'{}'
+            if event.get('isBase64Encoded'):
+                raw_body = base64.b64decode(raw_body)
+            body = orjson.loads(raw_body)
+        except (orjson.JSONDecodeError, binascii.Error):
             return error_response(400, "Invalid JSON in request body")
         
         query = body.get('query')
@@ -97,28 +136,29 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         print(f"🔑 Mapped client '{client_id}' to role: {lf_role_arn}")
         
-        # Step 4: Assume Lake Formation role
-        assumed_credentials = assume_role(lf_role_arn, client_id)
+        # Step 4: Get Athena client for the assumed Lake Formation role
+        athena = get_athena_client(lf_role_arn, client_id)
         
-        if not assumed_credentials:
+        if not athena:
             return error_response(500, "Failed to assume Lake Formation role")
         
         # Step 5: Execute Athena query
-        query_execution_id = start_athena_query(query, assumed_credentials)
+        query_execution_id = start_athena_query(athena, query)
         
         if not query_execution_id:
             return error_response(500, "Failed to start Athena query")
         
         # Step 6: Wait for query completion
-        status = wait_for_query_completion(query_execution_id, assumed_credentials)
+        status = wait_for_query_completion(athena, query_execution_id)
         
         if status != 'SUCCEEDED':
             return error_response(500, f"Query failed with status: {status}")
         
         # Step 7: Get query results
-        results = get_query_results(query_execution_id, assumed_credentials)
+        results = get_query_results(athena, query_execution_id)
+        row_count = max(len(results) - 1, 0)  # excluding header row
         
-        print(f"✅ Query completed successfully - Rows: {len(results) - 1}")
+        print(f"✅ Query completed successfully - Rows: {row_count}")
         
         return success_response({
             'success': True,
@@ -128,7 +168,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'lfRole': lf_role_arn,
             'queryExecutionId': query_execution_id,
             'query': query,
-            'rowCount': len(results) - 1,
+            'rowCount': row_count,
             'data': results
         })
         
@@ -141,45 +181,44 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
 
 def decode_jwt_token(token: str) -> Optional[Dict[str, Any]]:
     """
-    Decode JWT token (without signature verification for now).
-    In production, you should verify the signature using Cognito's public keys.
+    Verify JWT signature against Cognito's JWKS and return its claims.
+    Verified claims are cached per token; expiry is re-checked on every call.
     """
     try:
-        # JWT has 3 parts: header.payload.signature
-        parts = token.split('.')
+        token_data = _verify_jwt_token(token)
         
-        if len(parts) != 3:
-            print("❌ Invalid JWT format")
-            return None
-        
-        # Decode payload (second part)
-        payload = parts[1]
-        
-        # Add padding if needed (JWT base64 may not be padded)
-        padding = 4 - (len(payload) % 4)
-        if padding != 4:
-            payload += '=' * padding
-        
-        decoded = base64.urlsafe_b64decode(payload)
-        token_data = json.loads(decoded)
-        
-        # Check expiration
-        exp = token_data.get('exp', 0)
-        if time.time() > exp:
+        # Check expiration (cached claims may outlive the token)
+        if time.time() > token_data.get('exp', 0):
             print("❌ Token expired")
             return None
         
-        # Validate issuer (Cognito User Pool)
-        expected_issuer = f"https://cognito-idp.{COGNITO_REGION}.amazonaws.com/{COGNITO_USER_POOL_ID}"
-        if token_data.get('iss') != expected_issuer:
-            print(f"❌ Invalid issuer: {token_data.get('iss')}")
-            return None
-        
         return token_data
         
-    except Exception as e:
-        print(f"❌ Token decode error: {str(e)}")
+    except jwt.ExpiredSignatureError:
+        print("❌ Token expired")
+        return None
+    except jwt.InvalidIssuerError:
+        print("❌ Invalid issuer")
         return None
+    except jwt.PyJWTError as e:
+        print(f"❌ Token verification error: {str(e)}")
+        return None
+
+
+@lru_cache(maxsize=1024)
+def _verify_jwt_token(token: str) -> Dict[str, Any]:
+    """
+    Verify RS256 signature, expiration and issuer (Cognito User Pool).
+    Cognito access tokens carry client_id instead of aud, so aud is not checked.
+    """
+    signing_key = _jwks_client.get_signing_key_from_jwt(token)
+    return jwt.decode(
+        token,
+        key=signing_key.key,
+        algorithms=['RS256'],
+        issuer=_EXPECTED_ISSUER,
+        options={'verify_aud': False}
+    )
 
 
 def map_client_to_lf_role(client_id: str, scopes: list) -> Optional[str]:
@@ -192,17 +231,20 @@ def map_client_to_lf_role(client_id: str, scopes: list) -> Optional[str]:
     """
     # Extract client name from client_id (format: "5abc123def" or "etl-service-client")
     # Try to match against our known client prefixes
-    for client_prefix, role_arn in CLIENT_ROLE_MAPPING.items():
-        if client_prefix in client_id.lower():
-            print(f"🔑 Matched client prefix '{client_prefix}' → {role_arn}")
-            return role_arn
+    matched_prefixes = _CLIENT_PREFIX_RE.findall(client_id.lower())
+    if matched_prefixes:
+        client_prefix = min(matched_prefixes, key=_CLIENT_PREFIX_PRIORITY.__getitem__)
+        role_arn = CLIENT_ROLE_MAPPING[client_prefix]
+        print(f"🔑 Matched client prefix '{client_prefix}' → {role_arn}")
+        return role_arn
     
     # Fallback: Map by scope
     # Use highest privilege scope found
-    if 'athena-api/query.admin' in scopes or 'athena-api/query.write' in scopes:
+    granted_scopes = frozenset(scopes)
+    if granted_scopes & _WRITE_SCOPES:
         print(f"🔑 Scope-based mapping: write/admin scope → {LF_SUPER_ROLE_ARN}")
         return LF_SUPER_ROLE_ARN
-    elif 'athena-api/query.read' in scopes:
+    elif granted_scopes & _READ_SCOPES:
         print(f"🔑 Scope-based mapping: read scope → {LF_DEV_ROLE_ARN}")
         return LF_DEV_ROLE_ARN
     
@@ -211,7 +253,33 @@ def map_client_to_lf_role(client_id: str, scopes: list) -> Optional[str]:
     return None
 
 
-def assume_role(role_arn: str, session_name: str) -> Optional[Dict[str, str]]:
+def get_athena_client(role_arn: str, session_name: str) -> Optional[Any]:
+    """
+    Return an Athena client for the assumed role, creating it only when
+    no cached client exists or its credentials are close to expiry.
+    """
+    cache_key = (role_arn, session_name)
+    cached = _assumed_athena_clients.get(cache_key)
+    if cached and cached[1] - time.time() > CREDENTIAL_REFRESH_MARGIN_SECONDS:
+        return cached[0]
+    
+    credentials = assume_role(role_arn, session_name)
+    if not credentials:
+        return None
+    
+    athena = boto3.client(
+        'athena',
+        region_name=REGION,
+        aws_access_key_id=credentials['AccessKeyId'],
+        aws_secret_access_key=credentials['SecretAccessKey'],
+        aws_session_token=credentials['SessionToken'],
+        config=ATHENA_CLIENT_CONFIG
+    )
+    _assumed_athena_clients[cache_key] = (athena, credentials['Expiration'].timestamp())
+    return athena
+
+
+def assume_role(role_arn: str, session_name: str) -> Optional[Dict[str, Any]]:
     """
     Assume IAM role and return temporary credentials.
     """
@@ -226,26 +294,19 @@ def assume_role(role_arn: str, session_name: str) -> Optional[Dict[str, str]]:
         return {
             'AccessKeyId': credentials['AccessKeyId'],
             'SecretAccessKey': credentials['SecretAccessKey'],
-            'SessionToken': credentials['SessionToken']
+            'SessionToken': credentials['SessionToken'],
+            'Expiration': credentials['Expiration']
         }
     except ClientError as e:
         print(f"❌ Failed to assume role {role_arn}: {e.response['Error']['Message']}")
         return None
 
 
-def start_athena_query(query: str, credentials: Dict[str, str]) -> Optional[str]:
+def start_athena_query(athena: Any, query: str) -> Optional[str]:
     """
     Start Athena query execution with assumed role credentials.
     """
     try:
-        athena = boto3.client(
-            'athena',
-            region_name=REGION,
-            aws_access_key_id=credentials['AccessKeyId'],
-            aws_secret_access_key=credentials['SecretAccessKey'],
-            aws_session_token=credentials['SessionToken']
-        )
-        
         response = athena.start_query_execution(
             QueryString=query,
             QueryExecutionContext={'Database': DATABASE_NAME},
@@ -261,19 +322,13 @@ def start_athena_query(query: str, credentials: Dict[str, str]) -> Optional[str]
         return None
 
 
-def wait_for_query_completion(query_execution_id: str, credentials: Dict[str, str], max_wait: int = 30) -> str:
+def wait_for_query_completion(athena: Any, query_execution_id: str, max_wait: int = 30) -> str:
     """
     Wait for Athena query to complete. Returns query status.
     """
-    athena = boto3.client(
-        'athena',
-        region_name=REGION,
-        aws_access_key_id=credentials['AccessKeyId'],
-        aws_secret_access_key=credentials['SecretAccessKey'],
-        aws_session_token=credentials['SessionToken']
-    )
-    
-    for i in range(max_wait):
+    deadline = time.monotonic() + max_wait
+    delay = POLL_INITIAL_DELAY
+    while time.monotonic() < deadline:
         try:
             response = athena.get_query_execution(QueryExecutionId=query_execution_id)
             status = response['QueryExecution']['Status']['State']
@@ -281,7 +336,8 @@ def wait_for_query_completion(query_execution_id: str, credentials: Dict[str, st
             if status in ['SUCCEEDED', 'FAILED', 'CANCELLED']:
                 return status
             
-            time.sleep(1)
+            time.sleep(delay * random.uniform(0.8, 1.2))
+            delay = min(delay * POLL_BACKOFF_FACTOR, POLL_MAX_DELAY)
             
         except ClientError as e:
             print(f"❌ Error checking query status: {e.response['Error']['Message']}")
@@ -290,27 +346,27 @@ def wait_for_query_completion(query_execution_id: str, credentials: Dict[str, st
     return 'TIMEOUT'
 
 
-def get_query_results(query_execution_id: str, credentials: Dict[str, str]) -> list:
+def iter_query_rows(athena: Any, query_execution_id: str) -> Iterator[List[str]]:
+    """
+    Yield Athena result rows (header first) as value lists, one 1000-row page at a time.
+    Each page is fetched only when the previous one has been consumed.
+    """
+    paginator = athena.get_paginator('get_query_results')
+    pages = paginator.paginate(
+        QueryExecutionId=query_execution_id,
+        PaginationConfig={'PageSize': RESULTS_PAGE_SIZE}
+    )
+    for page in pages:
+        for row in page['ResultSet']['Rows']:
+            yield [col.get('VarCharValue', '') for col in row['Data']]
+
+
+def get_query_results(athena: Any, query_execution_id: str) -> list:
     """
     Get Athena query results.
     """
     try:
-        athena = boto3.client(
-            'athena',
-            region_name=REGION,
-            aws_access_key_id=credentials['AccessKeyId'],
-            aws_secret_access_key=credentials['SecretAccessKey'],
-            aws_session_token=credentials['SessionToken']
-        )
-        
-        response = athena.get_query_results(QueryExecutionId=query_execution_id)
-        
-        # Convert to array format
-        results = []
-        for row in response['ResultSet']['Rows']:
-            results.append([col.get('VarCharValue', '') for col in row['Data']])
-        
-        return results
+        return list(iter_query_rows(athena, query_execution_id))
         
     except ClientError as e:
         print(f"❌ Failed to get query results: {e.response['Error']['Message']}")
@@ -321,11 +377,8 @@ def success_response(data: Dict[str, Any]) -> Dict[str, Any]:
     """Create success response."""
     return {
         'statusCode': 200,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*'
-        },
-        'body': json.dumps(data, default=str)
+        'headers': _RESPONSE_HEADERS,
+        'body': orjson.dumps(data, default=str).decode()
     }
 
 
@@ -333,12 +386,9 @@ def error_response(status_code: int, message: str) -> Dict[str, Any]:
     """Create error response."""
     return {
         'statusCode': status_code,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*'
-        },
-        'body': json.dumps({
+        'headers': _RESPONSE_HEADERS,
+        'body': orjson.dumps({
             'success': False,
             'error': message
-        })
+        }).decode()
     }
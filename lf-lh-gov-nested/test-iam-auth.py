@@ -2,11 +2,16 @@
 """
 Test IAM authentication for API Gateway endpoint.
 Uses SigV4 signing with AWS credentials.
+
+Usage: python test-iam-auth.py [request-count]
 """
+import sys
 import boto3
 import json
+import requests
 from botocore.auth import SigV4Auth
 from botocore.awsrequest import AWSRequest
+from requests.adapters import HTTPAdapter
 
 # IAM User credentials (lf-lh-dev-user-o-sp5-dev)
 ACCESS_KEY = "YOUR_AWS_ACCESS_KEY_ID"  # Replace with your actual access key
@@ -21,32 +26,34 @@ body = json.dumps({
     "limit": 5
 })
 
+# Number of requests to send (first pays the TLS handshake, the rest reuse the connection)
+REQUEST_COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+
 # Create a session with the IAM user credentials
 session = boto3.Session(
     aws_access_key_id=ACCESS_KEY,
     aws_secret_access_key=SECRET_KEY,
     region_name='ap-southeast-2'
 )
-
-# Create an AWS request
-request = AWSRequest(method='POST', url=URL, data=body, headers={
-    'Content-Type': 'application/json'
-})
-
-# Sign the request with SigV4
-SigV4Auth(session.get_credentials(), "execute-api", "ap-southeast-2").add_auth(request)
-
-# Send the request
-import urllib.request
-req = urllib.request.Request(
-    URL,
-    data=body.encode('utf-8'),
-    headers=dict(request.headers)
-)
-
-try:
-    with urllib.request.urlopen(req) as response:
-        result = json.loads(response.read().decode('utf-8'))
-        print(json.dumps(result, indent=2))
-except urllib.error.HTTPError as e:
-    print(f"Error {e.code}: {e.read().decode('utf-8')}")
+credentials = session.get_credentials()
+
+# Pooled HTTP session - keeps the HTTPS connection alive between requests
+http = requests.Session()
+http.mount('https://', HTTPAdapter(pool_connections=10, pool_maxsize=10))
+
+for i in range(REQUEST_COUNT):
+    # Create an AWS request and sign it with SigV4 (signatures are timestamped, so sign each send)
+    request = AWSRequest(method='POST', url=URL, data=body, headers={
+        'Content-Type': 'application/json'
+    })
+    SigV4Auth(credentials, "execute-api", "ap-southeast-2").add_auth(request)
+    
+    # Send the request
+    response = http.post(URL, data=body, headers=dict(request.headers))
+    elapsed_ms = response.elapsed.total_seconds() * 1000
+    
+    if response.ok:
+        print(f"Request {i + 1}/{REQUEST_COUNT} ({elapsed_ms:.0f} ms):")
+        print(json.dumps(response.json(), indent=2))
+    else:
+        print(f"Error {response.status_code} ({elapsed_ms:.0f} ms): {response.text}")
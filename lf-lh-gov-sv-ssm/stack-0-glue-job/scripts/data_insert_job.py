@@ -28,11 +28,17 @@ data = [
 columns = ["id", "name", "email", "ssn", "created_at"]
 df = spark.createDataFrame(data, columns)
 
-# Write to S3 in Parquet format
+# Write to S3 in Parquet format - one ZSTD file per run with 128 MB row groups to avoid small files
 output_path = f"s3://{args['bucket_name']}/data/sample_data/"
-df.write.mode("append").parquet(output_path)
+df.coalesce(1).write \
+    .option("compression", "zstd") \
+    .option("parquet.block.size", 134217728) \
+    .option("parquet.page.size", 1048576) \
+    .mode("append") \
+    .parquet(output_path)
 
-print(f"Successfully inserted {df.count()} records to {output_path}")
+# Row count comes from the driver-side list; df.count() would rerun the Spark job
+print(f"Successfully inserted {len(data)} records to {output_path}")
 print(f"Database: {args['database_name']}, Table: {args['table_name']}")
 
 job.commit()
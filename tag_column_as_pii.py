@@ -1,6 +1,7 @@
 import boto3
 import sys
 import os
+from functools import lru_cache
 
 def get_param(name):
     # Glue passes params as --key value, not --key=value
@@ -10,12 +11,19 @@ def get_param(name):
             return sys.argv[idx + 1]
     return os.environ.get(name)
 
+@lru_cache(maxsize=1)
+def _account_id():
+    # AWS_ACCOUNT_ID, when set by the deployer, avoids the STS round trip entirely
+    return os.environ.get('AWS_ACCOUNT_ID') or boto3.client('sts').get_caller_identity()['Account']
+
 def main():
     db = get_param('db')
     table = get_param('table')
-    column = get_param('column')
-    if not db or not table or not column:
-        print("Usage: --db <database> --table <table> --column <column>")
+    # --columns takes a comma-separated list; --column is kept for single-column callers
+    columns_param = get_param('columns') or get_param('column')
+    columns = [c.strip() for c in columns_param.split(',') if c.strip()] if columns_param else []
+    if not db or not table or not columns:
+        print("Usage: --db <database> --table <table> --columns <column>[,<column>...]")
         sys.exit(1)
 
     client = boto3.client('lakeformation')
@@ -23,10 +31,10 @@ def main():
     response = client.add_lf_tags_to_resource(
         Resource={
             'TableWithColumns': {
-                'CatalogId': boto3.client('sts').get_caller_identity()['Account'],
+                'CatalogId': _account_id(),
                 'DatabaseName': db,
                 'Name': table,
-                'ColumnNames': [column]
+                'ColumnNames': columns
             }
         },
         LFTags=[